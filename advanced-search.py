@@ -1,22 +1,30 @@
 import argparse
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from tqdm import tqdm
-from dotenv import load_dotenv
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 import shutil
+import sys
 import textwrap
-from wcwidth import wcswidth
+try:
+    from cwcwidth import wcswidth  # C implementation, same API as wcwidth
+except ImportError:
+    from wcwidth import wcswidth
 
-end_date = datetime.now(timezone.utc)
+# Spotify's added_at is fixed-width UTC, so strings in this format sort chronologically
+ADDED_AT_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# With a market set, Spotify leaves the large available_markets lists out of each track
+MARKET = "from_token"
+MAX_WORKERS = 8  # small pool so parallel paging stays under Spotify's rate limits
 
-load_dotenv()
+end_date = datetime.now(timezone.utc)
 
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope="user-library-read"))
+# Artist/album names repeat a lot across a library, so memoise their widths
+_cached_width = functools.lru_cache(maxsize=4096)(wcswidth)
 
 def pad_cell(text, width):
-    text_width = wcswidth(text)
+    text_width = _cached_width(text)
     pad_len = max(0, width - text_width)
     return text + " " * pad_len
 
@@ -29,51 +37,71 @@ def print_verbose_table(tracks, verbosity=1):
     min_col_widths = [10] * len(headers)
     col_ratios = [0.25, 0.25, 0.20, 0.10] + ([0.10, 0.10] if verbosity >= 2 else [])
     max_total_width = term_width - (len(headers) + 1) * 3 - 1
-    col_widths = [
+    col_widths = tuple(
         max(min_w, int(max_total_width * ratio)) for min_w, ratio in zip(min_col_widths, col_ratios)
-    ]
+    )
+
+    # One reusable wrapper per column instead of a new TextWrapper per cell
+    wrappers = tuple(textwrap.TextWrapper(width=width) for width in col_widths)
+
+    # Widths/wrappers are bound as defaults so the per-cell helpers read them as locals
+    def wrap_cell(i, text, _widths=col_widths, _wrappers=wrappers):
+        # Most cells are short plain ASCII that textwrap would return unchanged
+        if text and len(text) <= _widths[i] and text.isascii() and text.isprintable() and not text.endswith(' '):
+            return [text]
+        return _wrappers[i].wrap(text) or ['']
 
     def wrap_row(row):
-        wrapped = [textwrap.wrap(col, width) or [''] for col, width in zip(row, col_widths)]
+        wrapped = [wrap_cell(i, col) for i, col in enumerate(row)]
         max_lines = max(len(col) for col in wrapped)
         return [
             [col[i] if i < len(col) else '' for col in wrapped]
             for i in range(max_lines)
         ]
 
+    # Collect every line and write the table out once at the end
+    lines = []
+
+    border = '+'
+    for width in col_widths:
+        border += '-' * (width + 2) + '+'
+
     def draw_border():
-        line = '+'
-        for width in col_widths:
-            line += '-' * (width + 2) + '+'
-        print(line)
+        lines.append(border)
 
-    def draw_row(cells):
+    def draw_row(cells, _widths=col_widths):
         for row in wrap_row(cells):
             line = '|'
             for i, cell in enumerate(row):
-                line += ' ' + pad_cell(cell, col_widths[i]) + ' |'
-            print(line)
+                line += ' ' + pad_cell(cell, _widths[i]) + ' |'
+            lines.append(line)
 
 
     draw_border()
     draw_row(headers)
     draw_border()
 
-    for item in tracks:
+    def build_row(item):
         track = item["track"]
+        album = track["album"]
         row = [
             track["name"],
-            ", ".join(a["name"] for a in track["artists"]),
-            track["album"]["name"],
-            track["album"]["release_date"]
+            ", ".join([a["name"] for a in track["artists"]]),
+            album["name"],
+            album["release_date"]
         ]
         if verbosity >= 2:
-            added = item.get("added_at", "-").split("T")[0] if "added_at" in item else "-"
+            added = item["added_at"].split("T")[0] if "added_at" in item else "-"
             play_count = '-'  # Placeholder
             row += [added, str(play_count)]
-        draw_row(row)
+        return row
+
+    for item in tracks:
+        draw_row(build_row(item))
         draw_border()
 
+    sys.stdout.write("\n".join(lines) + "\n")
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Advanced Spotify Song Search")
     parser.add_argument("-l", "--liked", action="store_true", help="Limit to liked songs")
@@ -83,45 +111,60 @@ def parse_args():
     parser.add_argument("-v", "--verbose", type=int, default=0, help="Verbosity level (0 = names only, 1 = table)")
     return parser.parse_args()
 
-def get_liked_tracks(start_date=None, end_date=None):
+def saved_track_pages(sp, limit, concurrent=False):
+    batch = sp.current_user_saved_tracks(limit=limit, offset=0, market=MARKET)
+    yield batch
+
+    if concurrent:
+        # Every offset up to batch["total"] is known now, so fetch the rest in parallel
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            yield from pool.map(
+                lambda offset: sp.current_user_saved_tracks(limit=limit, offset=offset, market=MARKET),
+                range(limit, batch["total"], limit)
+            )
+        return
+
+    offset = 0
+    while batch["next"] is not None:
+        offset += limit
+        batch = sp.current_user_saved_tracks(limit=limit, offset=offset, market=MARKET)
+        yield batch
+
+def get_liked_tracks(sp, start_date=None, end_date=None):
     results = []
     limit = 50
-    offset = 0
+
+    start_str = start_date.strftime(ADDED_AT_FORMAT) if start_date else None
+    end_str = end_date.strftime(ADDED_AT_FORMAT) if end_date else None
+
+    # Without a start date every page is needed; with one we stop early, so page sequentially
+    pages = saved_track_pages(sp, limit, concurrent=start_date is None)
 
     with tqdm(desc="Filtering liked songs") as pbar:
-        while True:
-            batch = sp.current_user_saved_tracks(limit=limit, offset=offset)
+        for batch in pages:
             items = batch["items"]
             if not items:
                 break
 
-            for item in items:
-                added_at = datetime.strptime(item["added_at"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-
-                # Stop if we’ve gone past the start_date
-                if start_date and added_at < start_date:
-                    return results
-
-                if start_date and added_at < start_date:
-                    continue
-                if end_date and added_at > end_date:
-                    continue
+            kept = [
+                item for item in items
+                if (not start_str or item["added_at"] >= start_str)
+                and (not end_str or item["added_at"] <= end_str)
+            ]
+            results.extend(kept)
+            pbar.update(len(kept))
 
-                results.append(item)
-                pbar.update(1)
-
-            if batch["next"] is None:
+            # Spotify returns most recent first, so stop once we’ve gone past the start_date
+            if start_str and items[-1]["added_at"] < start_str:
                 break
 
-            offset += limit
-
     return results
 
 
 def filter_by_date(tracks, start=None, end=None):
     filtered = []
     for item in tracks:
-        added_at = datetime.strptime(item["added_at"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        added_at = datetime.fromisoformat(item["added_at"].replace("Z", "+00:00"))
         if start and added_at < start:
             continue
         if end and added_at > end:
@@ -144,7 +187,14 @@ def main():
             end_date = datetime.strptime(args.added_end, "%Y-%m-%d").replace(tzinfo=timezone.utc)
 
     if args.liked:
-        tracks = get_liked_tracks(start_date=start_date, end_date=end_date)
+        # Deferred so importing this module (or --help) doesn't pull in dotenv/OAuth
+        from dotenv import load_dotenv
+        import spotipy
+        from spotipy.oauth2 import SpotifyOAuth
+
+        load_dotenv()
+        sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope="user-library-read"))
+        tracks = get_liked_tracks(sp, start_date=start_date, end_date=end_date)
 
         if args.verbose == 0:
             for item in tracks:
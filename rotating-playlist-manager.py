@@ -1,19 +1,28 @@
+import json
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 UTC = timezone.utc
-from spotipy import Spotify
-from spotipy.oauth2 import SpotifyOAuth
-from dotenv import load_dotenv
-
-load_dotenv()
 
 SCOPE = "user-library-read playlist-modify-public playlist-modify-private playlist-read-private playlist-read-collaborative"
 MONTHS_BACK = 12
 PLURAL = 's' if MONTHS_BACK > 1 else ''
 ROTATION_NAME = f"Rotation: Last {MONTHS_BACK} Month{PLURAL}"
+# Trims available_markets from saved-track pages, but also turns on track relinking
+MARKET = "from_token"
+# Must match Spotify's added_at exactly; the cutoff is compared as a string
+ADDED_AT_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+MAX_WORKERS = 8  # threads used by fetch_all_pages
+LIKED_SNAPSHOT_CACHE = ".cache_liked_snapshot"
 
 def init_spotify_client():
+    # Deferred so importing this module doesn't pull in dotenv/OAuth
+    from dotenv import load_dotenv
+    from spotipy import Spotify
+    from spotipy.oauth2 import SpotifyOAuth
+
+    load_dotenv()
     return Spotify(auth_manager=SpotifyOAuth(
         scope=SCOPE,
         client_id=os.getenv("CLIENT_ID"),
@@ -22,83 +31,140 @@ def init_spotify_client():
         cache_path=".cache_rotation"
     ))
 
-def fetch_liked_tracks(sp, months=12):
-    cutoff = datetime.now(UTC) - timedelta(days=months*30)
-    results = []
+def load_liked_snapshot():
+    try:
+        with open(LIKED_SNAPSHOT_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_liked_snapshot(total, cutoff_str, tracks):
+    with open(LIKED_SNAPSHOT_CACHE, "w") as f:
+        json.dump({"total": total, "cutoff": cutoff_str, "tracks": tracks}, f)
+
+def scan_liked_tracks(sp, cutoff_str, snapshot=None):
+    # Returns the library total and [added_at, id] pairs since cutoff_str, newest first
+    usable = snapshot and snapshot["tracks"] and snapshot["cutoff"] <= cutoff_str
+    last_seen = snapshot["tracks"][0][0] if usable else None
+    tracks = []
+    total = None
     offset = 0
 
     while True:
-        items = sp.current_user_saved_tracks(limit=50, offset=offset)["items"]
+        resp = sp.current_user_saved_tracks(limit=50, offset=offset, market=MARKET)
+        if total is None:
+            total = resp["total"]
+        items = resp["items"]
         if not items:
             break
         for item in items:
-            added_at = datetime.strptime(item["added_at"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=UTC)
-            if added_at >= cutoff:
-                results.append(item["track"]["id"])
-            else:
-                return results  # Spotify returns most recent first, so we can stop
+            added_at = item["added_at"]
+            if last_seen and added_at <= last_seen:
+                # Caught up with the last run; if nothing was unliked since, the rest is the snapshot
+                if total == snapshot["total"] + len(tracks):
+                    tracks.extend(t for t in snapshot["tracks"] if t[0] >= cutoff_str)
+                    return total, tracks
+                last_seen = None  # library shrank, so keep paging for real
+            if added_at < cutoff_str:
+                return total, tracks  # Spotify returns most recent first, so we can stop
+            track = item["track"]
+            # Relinked tracks report the playable id; keep the one that was actually liked
+            tracks.append([added_at, track.get("linked_from", {}).get("id", track["id"])])
+        if resp.get("next") is None:
+            break
         offset += len(items)
-    return results
+    return total, tracks
+
+def fetch_liked_tracks(sp, months=12):
+    cutoff = datetime.now(UTC) - timedelta(days=months*30)
+    cutoff_str = cutoff.strftime(ADDED_AT_FORMAT)
+
+    total, tracks = scan_liked_tracks(sp, cutoff_str, load_liked_snapshot())
+    save_liked_snapshot(total, cutoff_str, tracks)
+    return [track_id for _, track_id in tracks]
+
+
+def fetch_all_pages(fetch, limit):
+    # The first page tells us the total, so the remaining offsets can be requested together
+    first = fetch(limit=limit, offset=0)
+    pages = [first]
+    if first.get("next") is not None:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            pages.extend(pool.map(
+                lambda offset: fetch(limit=limit, offset=offset),
+                range(limit, first["total"], limit)
+            ))
+    return pages
 
 
 def get_all_user_playlists(sp) -> list[dict]:
-    playlists = []
-    offset = 0
+    pages = fetch_all_pages(sp.current_user_playlists, limit=50)
 
-    while True:
-        response = sp.current_user_playlists(limit=50, offset=offset)
+    # Size the list from the reported total and fill it page by page
+    playlists = [None] * pages[0].get('total', 0)
+    offset = 0
+    for response in pages:
         items = response.get('items', [])
-        if not items:
-            break
-        playlists.extend(items)
+        playlists[offset:offset + len(items)] = items
         offset += len(items)
+    del playlists[offset:]
 
     return playlists
 
 
-def find_or_create_playlist(sp, user_id, name):
-    offset = 0
-    while True:
-        resp = sp.current_user_playlists(limit=50, offset=offset)
-        for pl in resp.get("items", []):
-            if pl["name"] == name and pl["owner"]["id"] == user_id:
-                return pl["id"]
-        if resp["next"] is None:
-            break
-        offset += 50
+def find_or_create_playlist(sp, user_id, name, playlists=None):
+    if playlists is None:
+        playlists = get_all_user_playlists(sp)
+
+    for pl in playlists:
+        if pl["name"] == name and pl["owner"]["id"] == user_id:
+            return pl["id"]
 
     new_pl = sp.user_playlist_create(user=user_id, name=name, public=False)
     return new_pl["id"]
 
 def get_playlist_track_ids(sp, playlist_id):
     ids = []
-    offset = 0
-    while True:
-        resp = sp.playlist_items(playlist_id, fields="items.track.id,next", limit=100, offset=offset)
-        items = resp.get("items", [])
-        if not items:
-            break
-        ids.extend(track["track"]["id"] for track in items if track["track"])
-        offset += len(items)
+    pages = fetch_all_pages(
+        lambda limit, offset: sp.playlist_items(playlist_id, fields="items.track.id,next,total", limit=limit, offset=offset),
+        limit=100
+    )
+    for resp in pages:
+        ids.extend(track["track"]["id"] for track in resp.get("items", []) if track["track"])
     return ids
 
+def track_ids_fingerprint(track_ids):
+    # Order-independent; summing (rather than xor-ing) hashes keeps repeated ids from cancelling out
+    return len(track_ids), sum(map(hash, track_ids))
+
 def update_playlist_if_needed(sp, playlist_id, new_track_ids):
     existing_ids = get_playlist_track_ids(sp, playlist_id)
 
-    if set(existing_ids) == set(new_track_ids):
+    # Common case: nothing changed, so skip building the sets at all
+    if track_ids_fingerprint(existing_ids) == track_ids_fingerprint(new_track_ids):
+        print("Playlist is already up to date.")
+        return
+
+    existing = set(existing_ids)
+    new = set(new_track_ids)
+    to_add = [track_id for track_id in new_track_ids if track_id not in existing]
+    to_remove = list(existing - new)
+
+    if not to_add and not to_remove:
         print("Playlist is already up to date.")
         return
 
-    # Clear and re-add (Spotify API does not support replace in one call)
-    sp.playlist_replace_items(playlist_id, new_track_ids[:100])
-    for i in range(100, len(new_track_ids), 100):
-        sp.playlist_add_items(playlist_id, new_track_ids[i:i+100])
+    # Only send the delta, in the 100-item batches the Spotify API allows.
+    # New likes go in at the top so the playlist stays newest-first.
+    for i in range(0, len(to_remove), 100):
+        sp.playlist_remove_all_occurrences_of_items(playlist_id, to_remove[i:i+100])
+    for i in range(0, len(to_add), 100):
+        sp.playlist_add_items(playlist_id, to_add[i:i+100], position=i)
 
-    print(f"Updated playlist with {len(new_track_ids)} tracks.")
+    print(f"Updated playlist: added {len(to_add)}, removed {len(to_remove)} tracks.")
 
 def main():
     sp = init_spotify_client()
-    user_id = sp.current_user()["id"]
 
     track_ids = fetch_liked_tracks(sp, months=MONTHS_BACK)
     print(f"Found {len(track_ids)} liked tracks from last {MONTHS_BACK} months.")
@@ -126,7 +192,9 @@ def main():
 
         if target_playlist == None:
             print("Target playlist not found, creating new playlist...")
-            target_playlist = find_or_create_playlist(sp, user_id, ROTATION_NAME)
+            # Only needed to create the playlist, so warm runs skip the request
+            user_id = sp.current_user()["id"]
+            target_playlist = find_or_create_playlist(sp, user_id, ROTATION_NAME, playlists=playlists)
             update_playlist_if_needed(sp, target_playlist, track_ids)
         else:
             print("Target playlist found, checking for updates...")